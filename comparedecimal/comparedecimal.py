@@ -24,12 +24,31 @@ along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
 
 
 import argparse
+import concurrent.futures
 import csv
-import math
+import functools
+import os
 import re
+import string
 from collections import namedtuple
 from enum import Enum
-from typing import List, Optional
+from itertools import chain, zip_longest
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+_QUOTE_CHAR = "\""
+_BOM = "\ufeff"
+# Characters which can't start a string accepted by float(). The letters
+# i and n are allowed through since they begin "inf", "infinity", and "nan".
+_NON_NUMERIC_START = frozenset(string.ascii_letters + string.punctuation) - \
+    frozenset("iInN+-.")
+# Line lists shorter than this aren't worth the overhead of a process pool.
+_MIN_PARALLEL_LINES = 10000
+_POWERS_OF_TEN = tuple(10**i for i in range(64))
+# Only the two mantissa groups are captured, so that joining the match's
+# groups gives the mantissa digits directly. The leading ^ is implied by
+# re.match.
+_NUMBER_REGEX = re.compile(r"[-+]?([0-9]*)\.?([0-9]+)(?:[eE][-+]?[0-9]+)?$")
 
 
 def main():
@@ -38,7 +57,7 @@ def main():
 
     Run this module as a command-line utility with files and options
     specified as command-line arguments. The files will be read and
-    compared using DecimalComparer.compare_line_lists, and the results
+    compared using DecimalComparer.compare_streams, and the results
     of comparison written to the standard output in a human-readable
     format.
 
@@ -53,20 +72,18 @@ def main():
                         help="threshold for considering values \"close\", "
                              "as a decimal fraction of the smaller value",
                         default=0.01)
+    parser.add_argument("-k", "--keep-initial-space", action="store_true",
+                        help="don't ignore whitespace after delimiters")
     parser.add_argument("FILE1", type=str)
     parser.add_argument("FILE2", type=str)
     args = parser.parse_args()
 
-    with open(args.FILE1) as fh:
-        lines0 = fh.readlines()
-
-    with open(args.FILE2) as fh:
-        lines1 = fh.readlines()
-
     separator = bytes(args.delimiter, "utf-8").decode("unicode_escape")
-    comparer = DecimalComparer(separator=separator,
-                               closeness_threshold=args.threshold)
-    result = comparer.compare_line_lists(lines0, lines1)
+    comparer = DecimalComparer(
+        separator=separator, closeness_threshold=args.threshold,
+        skip_initial_space=not args.keep_initial_space)
+    with open(args.FILE1) as fh0, open(args.FILE2) as fh1:
+        result = comparer.compare_streams(fh0, fh1)
 
     for level, count in sorted(list(comparer.totals.items()),
                                key=lambda x: x[0].value):
@@ -78,6 +95,80 @@ def main():
         print("First difference:", result)
 
 
+@functools.lru_cache(maxsize=65536)
+def _parse_decimal(literal: str) -> \
+        Tuple[Optional[float], Optional[int], int]:
+    """
+    Parse a string as a decimal number.
+
+    :param literal: a string
+    :return: a tuple of the string's float value (``None`` if it can't
+       be parsed as a float), its mantissa digits as an integer, ignoring
+       the decimal point (``None`` if it isn't a decimal literal), and its
+       number of significant figures (-1 if it isn't a decimal literal)
+    """
+    try:
+        value = float(literal)
+    except ValueError:
+        return None, None, -1
+    # Plain integers (IDs, counts, etc.) are common, and don't need the
+    # regex: their mantissa digits are simply the digits themselves.
+    unsigned = literal[1:] if literal[:1] in ("+", "-") else literal
+    if unsigned and not unsigned.lstrip("0123456789"):
+        digits = unsigned
+    else:
+        match = _NUMBER_REGEX.match(literal)
+        if match is None:
+            return value, None, -1
+        digits = "".join(match.groups())
+    # The digits are converted to an integer here, rather than at each
+    # comparison, so that the conversion is cached along with the rest.
+    return value, int(digits), len(digits.lstrip("0"))
+
+
+def _mantissa_difference(int0: int, int1: int,
+                         positive0: float, positive1: float) -> int:
+    """Return the absolute difference between two padded mantissas."""
+
+    # This is a bit of a hack to account for the rare cases where
+    # the two numbers straddle a power of ten (e.g. 9.9952E-8 vs. 1.00E-07).
+    # In this case the sig. fig. counting technique puts us out by
+    # an order of magnitude. We do a straightforward empirical check to
+    # correct this, also checking the parsed float values to make sure
+    # that we're not "correcting" a real difference in the original numbers.
+    if int0 * 9 < int1 and positive0 * 9 >= positive1:
+        int0 *= 10
+    if int1 * 9 < int0 and positive1 * 9 >= positive0:
+        int1 *= 10
+
+    return abs(int0 - int1)
+
+
+def _compare_line_list_chunk(separator: str, closeness_threshold: float,
+                             skip_initial_space: bool,
+                             start: int, lines0: List[str],
+                             lines1: List[str]) -> Tuple[dict, Optional[str]]:
+    """
+    Compare one chunk of two quotation-free lists of lines.
+
+    This is run in a worker process by
+    DecimalComparer.compare_line_lists_parallel.
+
+    :param separator: the field separator
+    :param closeness_threshold: the threshold for close values
+    :param skip_initial_space: whether to ignore whitespace after separators
+    :param start: the index of the chunk's first line in the full lists
+    :param lines0: a list of lines
+    :param lines1: another list of lines of the same length
+    :return: the comparer's totals and the first difference, if any
+    """
+    comparer = DecimalComparer(separator, closeness_threshold,
+                               skip_initial_space)
+    first_difference = comparer._first_difference(
+        comparer._differing_rows(lines0, lines1, start))
+    return comparer.totals, first_difference
+
+
 class EqualityLevel(Enum):
     """
     Represents the degree of similarity between two strings.
@@ -132,7 +223,8 @@ class DecimalComparer:
     stored in the instance attribute ``totals``.
     """
 
-    def __init__(self, separator: str = ",", closeness_threshold: float = 0.01):
+    def __init__(self, separator: str = ",", closeness_threshold: float = 0.01,
+                 skip_initial_space: bool = True):
         """
         Create a new comparer.
 
@@ -142,6 +234,10 @@ class DecimalComparer:
                as close if they have the same sign and
                max(abs(a), abs(b)) <= (1 + closeness_threshold) *
                min(abs(a), abs(b)).
+        :param skip_initial_space: whether to ignore whitespace immediately
+               following the separator when splitting lines into fields.
+               Turning this off saves a little time on inputs known not
+               to contain such whitespace.
         """
         self.separator = separator  # type: str
         """the field separator to use when comparing lines"""
@@ -149,6 +245,8 @@ class DecimalComparer:
         """an accumulator to count comparison results for each equality level"""
         self.closeness_threshold = closeness_threshold  # type: float
         """the fractional threshold at which values are regarded as close"""
+        self.skip_initial_space = skip_initial_space  # type: bool
+        """whether to ignore whitespace following the separator"""
 
     def compare_strings(self, decimal0: str, decimal1: str) -> EqualityLevel:
         """
@@ -169,16 +267,26 @@ class DecimalComparer:
         if string0 == string1:
             return EqualityLevel.IDENTICAL
 
-        try:
-            floats = [float(s) for s in (string0, string1)]
-            sig_figs =\
-                [DecimalComparer._sig_figs(s) for s in (string0, string1)]
-        except ValueError:
-            # If the strings are unequal and one or both can't be parsed
-            # as floats, then they're clearly numerically unequal.
+        if string0[:1] in _NON_NUMERIC_START or \
+                string1[:1] in _NON_NUMERIC_START:
+            # Most non-numeric fields can be recognized from their first
+            # character, which is much cheaper than letting float() fail.
+            return EqualityLevel.UNEQUAL
+
+        # Reading the float value and the mantissa digits is the expensive
+        # part of a comparison, and the results are cached by _parse_decimal,
+        # so repeated values (e.g. in categorical columns) are parsed once.
+        # If the strings are unequal and one or both can't be parsed
+        # as floats, then they're clearly numerically unequal. There's no
+        # need to parse the second string if the first one fails.
+        float0, int0, sig_figs0 = _parse_decimal(string0)
+        if float0 is None:
+            return EqualityLevel.UNEQUAL
+        float1, int1, sig_figs1 = _parse_decimal(string1)
+        if float1 is None:
             return EqualityLevel.UNEQUAL
 
-        if floats[0] == floats[1]:
+        if float0 == float1:
             # This catches the case where we're comparing -0 with 0,
             # which would otherwise return an incorrect False result.
             # It should also catch most other "numerically equal" cases,
@@ -186,44 +294,42 @@ class DecimalComparer:
             # floating-point equality testing, they will be caught later.
             return EqualityLevel.NUMERICALLY_EQUAL
 
-        if math.copysign(floats[0], floats[1]) != floats[0]:
+        if (float0 < 0.0) != (float1 < 0.0):
             # opposite signs (and we know they're non-zero)
             return EqualityLevel.UNEQUAL
 
-        positives = [abs(x) for x in floats]
+        positive0, positive1 = abs(float0), abs(float1)
 
-        if positives[0] >= positives[1] * 10 or \
-           positives[1] >= positives[0] * 10:
+        if positive0 >= positive1 * 10 or positive1 >= positive0 * 10:
             return EqualityLevel.UNEQUAL
         # We've now established that they have the same order of magnitude.
         # Next step is to compare the digits.
 
-        digits = [DecimalComparer._extract_mantissa_digits(s)
-                  for s in (string0, string1)]
-        digits_padded = \
-            [digits[i] + ("0" * (max(sig_figs) - sig_figs[i])) for i in (0, 1)]
-        max_diff = 10**(max(sig_figs) - min(sig_figs)) // 2
-
-        ints = [int(d) for d in digits_padded]
-
-        # This is a bit of a hack to account for the rare cases where
-        # the two numbers straddle a power of ten (e.g. 9.9952E-8 vs. 1.00E-07).
-        # In this case the sig. fig. counting technique puts us out by
-        # an order of magnitude. We do a straightforward empirical check to
-        # correct this, also checking the parsed float values to make sure
-        # that we're not "correcting" a real difference in the original numbers.
-        if ints[0] * 9 < ints[1] and positives[0] * 9 >= positives[1]:
-            ints[0] *= 10
-        if ints[1] * 9 < ints[0] and positives[1] * 9 >= positives[0]:
-            ints[1] *= 10
-
-        actual_diff = abs(ints[0] - ints[1])
+        if int0 is None or int1 is None:
+            # float() accepts some strings with no decimal digits to compare
+            # (e.g. "nan"), and NaN passes both of the checks above.
+            return EqualityLevel.UNEQUAL
+
+        # Pad the mantissas to the same number of digits arithmetically,
+        # rather than by appending zeros to the strings before conversion.
+        # Only the one with fewer significant figures needs scaling, and
+        # the same power of ten gives the maximum compatible difference.
+        exponent = abs(sig_figs0 - sig_figs1)
+        scale = _POWERS_OF_TEN[exponent] \
+            if exponent < len(_POWERS_OF_TEN) else 10**exponent
+        if sig_figs0 < sig_figs1:
+            int0 *= scale
+        else:
+            int1 *= scale
+        max_diff = scale // 2
+
+        actual_diff = _mantissa_difference(int0, int1, positive0, positive1)
         if actual_diff == 0:
             return EqualityLevel.NUMERICALLY_EQUAL
         elif actual_diff <= max_diff:
             return EqualityLevel.COMPATIBLE
         else:
-            return self._unequal_or_close(positives[0], positives[1])
+            return self._unequal_or_close(positive0, positive1)
 
     def compare_string_lists(self, fields0: List[str], fields1: List[str]) ->\
             Optional[FieldDifference]:
@@ -248,13 +354,25 @@ class DecimalComparer:
                                    string1="{}".format(len(fields1)))
 
         first_difference = None
-        for i in range(len(fields0)):
-            level = self.compare_strings(fields0[i], fields1[i])
-            if level == EqualityLevel.UNEQUAL and \
-                    first_difference is None:
+        identical = 0
+        # Attribute lookups are hoisted out of the loop, since it runs
+        # once for every field in a file.
+        totals = self.totals
+        compare = self._compare_strings
+        unequal = EqualityLevel.UNEQUAL
+        for i, (string0, string1) in enumerate(zip(fields0, fields1)):
+            # Identical fields are by far the most common case, so we count
+            # them here rather than paying for a full comparison call.
+            if string0 == string1:
+                identical += 1
+                continue
+            level = compare(string0, string1)
+            totals[level] += 1
+            if level is unequal and first_difference is None:
                 first_difference = FieldDifference(
-                    field_index=i, string0=fields0[i], string1=fields1[i]
+                    field_index=i, string0=string0, string1=string1
                 )
+        totals[EqualityLevel.IDENTICAL] += identical
 
         return first_difference
 
@@ -277,19 +395,132 @@ class DecimalComparer:
             return "Unequal numbers of lines ({}, {})".\
                 format(len(lines0), len(lines1))
 
-        fields = []
-        for line_list in lines0, lines1:
-            fields_list = []
-            fields.append(fields_list)
-            reader = csv.reader(line_list,
-                                delimiter=self.separator,
-                                skipinitialspace=True)
-            for row in reader:
-                fields_list.append(row)
+        lines0 = DecimalComparer._without_bom(lines0)
+        lines1 = DecimalComparer._without_bom(lines1)
+
+        if not self._can_split(lines0, lines1):
+            # A quoted field may span several lines, so the lines can't
+            # be tokenized independently of each other.
+            # The rows are consumed from both readers in step, rather than
+            # being collected into lists first, so only one pair of rows is
+            # held in memory at a time.
+            readers = [self._reader(line_list)
+                       for line_list in (lines0, lines1)]
+            row_pairs = enumerate(zip_longest(*readers, fillvalue=[]))
+        else:
+            row_pairs = self._differing_rows(lines0, lines1)
+
+        return self._first_difference(row_pairs)
+
+    def compare_line_lists_parallel(self, lines0: List[str],
+                                    lines1: List[str],
+                                    workers: Optional[int] = None) ->\
+            Optional[str]:
+        """
+        Compare two lists of lines, dividing the work between processes.
+        The results are the same as those of ``compare_line_lists``, and
+        this object's ``totals`` attribute will be updated in the same way.
+        The lines are split into contiguous chunks, each of which is
+        compared in a separate process. Short lists, and lists which can't
+        be divided into fields line by line (e.g. because they contain
+        quotation marks, which may enclose line breaks) are compared in
+        this process.
 
+        :param lines0: a list of lines
+        :param lines1: another list of lines
+        :param workers: the maximum number of processes to use, which must
+           be at least 1; if ``None``, the number of processors on the
+           machine is used
+        :return: a string describing the first difference, or ``None``
+           if the lists are equal
+        """
+
+        if workers is not None and workers < 1:
+            raise ValueError("workers must be at least 1")
+
+        if len(lines0) != len(lines1) or \
+                len(lines0) < _MIN_PARALLEL_LINES or \
+                not self._can_split(lines0, lines1):
+            return self.compare_line_lists(lines0, lines1)
+
+        lines0 = DecimalComparer._without_bom(lines0)
+        lines1 = DecimalComparer._without_bom(lines1)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        chunk_size = -(-len(lines0) // workers)
+        starts = range(0, len(lines0), chunk_size)
+
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = executor.map(
+                _compare_line_list_chunk,
+                [self.separator] * len(starts),
+                [self.closeness_threshold] * len(starts),
+                [self.skip_initial_space] * len(starts),
+                starts,
+                [lines0[start:start + chunk_size] for start in starts],
+                [lines1[start:start + chunk_size] for start in starts])
+
+            # The chunks are in line order, so the first difference
+            # found in any chunk is the first difference overall.
+            first_difference = None
+            for totals, difference in results:
+                for level, count in totals.items():
+                    self.totals[level] += count
+                if first_difference is None:
+                    first_difference = difference
+
+        return first_difference
+
+    def compare_streams(self, stream0: Iterable[str],
+                        stream1: Iterable[str]) -> Optional[str]:
+        """
+        Compare two streams of lines, each containing multiple fields.
+        The streams (e.g. open file handles) are read and compared
+        row by row, so neither needs to be held in memory in its entirety.
+        This object's ``separator`` object will be used as the separator
+        when splitting a line into fields.
+        This object's ``totals`` attribute will be updated
+        with the results of the comparisons.
+
+        Unlike ``compare_line_lists``, this method can only detect that the
+        streams differ in length once it has compared the rows they have in
+        common. In that case ``totals`` includes the results for those rows,
+        and the returned description gives the numbers of rows (which may
+        differ from the numbers of lines if a quoted field spans lines).
+
+        :param stream0: an iterable of lines
+        :param stream1: another iterable of lines
+        :return: a string describing the first difference, or ``None``
+           if the streams are equal
+        """
+
+        readers = [self._reader(DecimalComparer._stream_without_bom(stream))
+                   for stream in (stream0, stream1)]
+        row_counts = [0, 0]
+
+        def row_pairs():
+            for line, rows in enumerate(zip_longest(*readers)):
+                if None in rows:
+                    # One stream has ended: count the rows left in the other.
+                    for i, reader in enumerate(readers):
+                        row_counts[i] = line + (rows[i] is not None) + \
+                            sum(1 for _ in reader)
+                    return
+                yield line, rows
+
+        first_difference = self._first_difference(row_pairs())
+        if row_counts[0] != row_counts[1]:
+            return "Unequal numbers of rows ({}, {})".format(*row_counts)
+        return first_difference
+
+    def _first_difference(
+            self,
+            row_pairs: Iterable[Tuple[int, Tuple[List[str], List[str]]]]) ->\
+            Optional[str]:
         first_difference = None
-        for line in range(len(fields[0])):
-            result = self.compare_string_lists(fields[0][line], fields[1][line])
+        for line, (fields0, fields1) in row_pairs:
+            result = self.compare_string_lists(fields0, fields1)
             if result is not None and first_difference is None:
                 if result.field_index == -1:
                     first_difference = \
@@ -303,24 +534,71 @@ class DecimalComparer:
 
         return first_difference
 
+    def _reader(self, lines: Iterable[str]):
+        return csv.reader(lines, delimiter=self.separator,
+                          skipinitialspace=self.skip_initial_space)
+
+    @staticmethod
+    def _without_bom(lines: List[str]) -> List[str]:
+        # Files saved by some programs (notably Excel) start with a UTF-8
+        # byte order mark, which would otherwise end up in the first field.
+        if lines and lines[0].startswith(_BOM):
+            return [lines[0][len(_BOM):]] + lines[1:]
+        return lines
+
+    @staticmethod
+    def _stream_without_bom(stream: Iterable[str]) -> Iterator[str]:
+        lines = iter(stream)
+        first_line = next(lines, None)
+        if first_line is None:
+            return lines
+        if first_line.startswith(_BOM):
+            first_line = first_line[len(_BOM):]
+        return chain([first_line], lines)
+
+    def _can_split(self, *line_lists: List[str]) -> bool:
+        # Without quotation marks, every line is a complete row, and
+        # str.split gives the same fields as csv.reader -- except when
+        # the separator is a space and initial spaces are skipped, in
+        # which case csv.reader treats a run of spaces as one separator.
+        if self.skip_initial_space and self.separator == " ":
+            return False
+        return not any(_QUOTE_CHAR in line for line in chain(*line_lists))
+
+    def _split(self, line: str) -> List[str]:
+        stripped = line.rstrip("\r\n")
+        if not stripped:
+            return []
+        fields = stripped.split(self.separator)
+        if self.skip_initial_space:
+            return [field.lstrip(" ") for field in fields]
+        return fields
+
+    def _differing_rows(self, lines0: List[str], lines1: List[str],
+                        start: int = 0) ->\
+            Iterator[Tuple[int, Tuple[List[str], List[str]]]]:
+        # Only to be used when _can_split is true. Identical lines can then
+        # be counted without splitting them: all their fields are
+        # identical, and the separators give their number.
+        for line, (line0, line1) in enumerate(zip(lines0, lines1), start):
+            if line0 == line1:
+                stripped = line0.rstrip("\r\n")
+                if stripped:
+                    self.totals[EqualityLevel.IDENTICAL] += \
+                        stripped.count(self.separator) + 1
+                continue
+            yield line, (self._split(line0), self._split(line1))
+
     def _unequal_or_close(self, a: float, b: float) -> EqualityLevel:
-        if max(a, b) <= min(a, b) * (1 + self.closeness_threshold):
+        larger, smaller = (a, b) if a >= b else (b, a)
+        if larger <= smaller * (1 + self.closeness_threshold):
             return EqualityLevel.CLOSE
         else:
             return EqualityLevel.UNEQUAL
 
-    @staticmethod
-    def _extract_mantissa_digits(literal: str) -> Optional[str]:
-        match = re.match(r"^[-+]?([0-9]*)\.?([0-9]+)([eE][-+]?[0-9]+)?$",
-                         literal)
-        if match is None:
-            return None
-        return (match.group(1) + match.group(2)).lstrip("0")
-
     @staticmethod
     def _sig_figs(literal: str) -> int:
-        digits = DecimalComparer._extract_mantissa_digits(literal)
-        return -1 if digits is None else len(digits)
+        return _parse_decimal(literal)[2]
 
 
 if __name__ == "__main__":
@@ -23,6 +23,8 @@ setuptools.setup(
                  "Topic :: Scientific/Engineering :: Information Analysis",
                  "Environment :: Console",
                  "Programming Language :: Python :: 3",
+                 "Programming Language :: Python :: Implementation :: CPython",
+                 "Programming Language :: Python :: Implementation :: PyPy",
                  "Intended Audience :: Science/Research"
                  ],
     entry_points={"console_scripts":
@@ -20,6 +20,7 @@ along with comparedecimal.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 from comparedecimal import DecimalComparer, EqualityLevel, FieldDifference
+import io
 import unittest
 import random
 
@@ -83,6 +84,9 @@ class TestCompareCsv(unittest.TestCase):
         check(EqualityLevel.COMPATIBLE, "-8.912E-3", "-89.1E-4")
         check(EqualityLevel.NUMERICALLY_EQUAL, "0", "0.000")
         check(EqualityLevel.NUMERICALLY_EQUAL, "-0", "0")
+        check(EqualityLevel.NUMERICALLY_EQUAL, "-0.0", "+0.00")
+        check(EqualityLevel.UNEQUAL, "-1.5", "+1.5")
+        check(EqualityLevel.UNEQUAL, "1e-5", "-1.0e-5")
         check(EqualityLevel.COMPATIBLE, "-5.99e3", "-5994")
         check(EqualityLevel.UNEQUAL, "foo", "bar")
         check(EqualityLevel.IDENTICAL, "foo", "foo")
@@ -93,6 +97,12 @@ class TestCompareCsv(unittest.TestCase):
         check(EqualityLevel.UNEQUAL, "2.0", "1.94")
         check(EqualityLevel.COMPATIBLE, "1.99", "1.995")
         check(EqualityLevel.COMPATIBLE, "0.05", "5.40000014e-02")
+        check(EqualityLevel.UNEQUAL, "nan", "5")
+        check(EqualityLevel.UNEQUAL, "nan", "NaN")
+        check(EqualityLevel.NUMERICALLY_EQUAL, "inf", "Infinity")
+        check(EqualityLevel.UNEQUAL, "foo", "1")
+        check(EqualityLevel.COMPATIBLE, "-269", "-27")
+        check(EqualityLevel.CLOSE, "1000", "1001")
 
         rnd = random.Random(42)
         for _ in range(10000):
@@ -110,6 +120,9 @@ class TestCompareCsv(unittest.TestCase):
         self.assertEqual(3, DecimalComparer._sig_figs("1.23E+10"))
         self.assertEqual(7, DecimalComparer._sig_figs("-765.4321"))
         self.assertEqual(1, DecimalComparer._sig_figs("8"))
+        self.assertEqual(1, DecimalComparer._sig_figs("-007"))
+        self.assertEqual(3, DecimalComparer._sig_figs("+120"))
+        self.assertEqual(-1, DecimalComparer._sig_figs("\u0661\u0662"))
         self.assertEqual(10, DecimalComparer._sig_figs("-12345.12345e11"))
         self.assertEqual(-1, DecimalComparer._sig_figs("not a number"))
         self.assertEqual(-1, DecimalComparer._sig_figs("nan"))
@@ -137,6 +150,65 @@ class TestCompareCsv(unittest.TestCase):
                 ["one\t\"two\"\tthree"]
             ))
 
+    def test_compare_linelists_identical_lines_counted(self):
+        self.assertIsNone(
+            self.comparer.compare_line_lists(
+                ["one\ttwo\n", "\n", "3.0\t4\tfive\n"],
+                ["one\ttwo\n", "\n", "3\t4\tfive\n"]
+            ))
+        self._check_totals_counts(0, 0, 0, 1, 4)
+
+    def test_compare_linelists_parallel(self):
+        lines0 = ["line\t{}\t1.0".format(i) for i in range(20000)]
+        lines1 = ["line\t{}\t1".format(i) for i in range(20000)]
+        lines1[15000] = "line\t15000\t2"
+        self.assertEqual(
+            "On line 15001: field 3 differs (1.0, 2)",
+            self.comparer.compare_line_lists_parallel(lines0, lines1, 3))
+        self._check_totals_counts(1, 0, 0, 19999, 40000)
+
+    def test_compare_linelists_parallel_invalid_workers(self):
+        with self.assertRaises(ValueError):
+            self.comparer.compare_line_lists_parallel(["1"], ["1"], 0)
+
+    def test_compare_linelists_space_separator(self):
+        comparer = DecimalComparer(separator=" ")
+        self.assertIsNone(
+            comparer.compare_line_lists(["one  2.0 3"], ["one 2 3"]))
+        self.assertEqual(1, comparer.totals[EqualityLevel.NUMERICALLY_EQUAL])
+        self.assertEqual(2, comparer.totals[EqualityLevel.IDENTICAL])
+
+    def test_compare_linelists_byte_order_mark(self):
+        self.assertIsNone(
+            self.comparer.compare_line_lists(
+                ["\ufeffone\t2.0", "three\t4"],
+                ["one\t2", "three\t4"]
+            ))
+        self._check_totals_counts(0, 0, 0, 1, 3)
+
+    def test_compare_linelists_initial_space(self):
+        lines0, lines1 = ["one\t 2.01"], ["one\t2.0"]
+        self.assertIsNone(self.comparer.compare_line_lists(lines0, lines1))
+        comparer = DecimalComparer(separator="\t", skip_initial_space=False)
+        self.assertIsInstance(comparer.compare_line_lists(lines0, lines1), str)
+
+    def test_compare_streams_numerically_equal(self):
+        self.assertIsNone(
+            self.comparer.compare_streams(
+                io.StringIO("same1\nsame\t3.00\t0\n"),
+                io.StringIO("same1\nsame\t3.0\t0.0\n")
+            ))
+        self._check_totals_counts(0, 0, 0, 2, 2)
+
+    def test_compare_streams_unequal_lengths(self):
+        self.assertEqual(
+            "Unequal numbers of rows (3, 1)",
+            self.comparer.compare_streams(
+                io.StringIO("one\ntwo\nthree\n"),
+                io.StringIO("one\n")
+            ))
+        self._check_totals_counts(0, 0, 0, 0, 1)
+
 
 if __name__ == "__main__":
     unittest.main()